@@ -1,16 +1,13 @@
 import streamlit as st
+import altair as alt
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import io
-from matplotlib.dates import DateFormatter
-import matplotlib.dates as mdates
+import threading
 import datetime
-import yfinance as yf
 
 from bollinger_strategy import BollingerBandsStrategy
-from utils import fetch_data, calculate_performance_metrics
-from bollinger_backtest import run_backtest
+from utils import fetch_data, calculate_performance_metrics_matrix
 
 # Set page configuration
 st.set_page_config(
@@ -77,66 +74,75 @@ else:
     window = 20  # Default value, will be optimized
     num_std = 2.0  # Default value, will be optimized
 
+# Warm up the compiled kernels once for the lifetime of the server
+@st.cache_resource
+def _warm_up_kernels():
+    # Trigger compilation (or loading from the on-disk cache) once per process
+    warm_up = pd.DataFrame({'Close': 1.5 + 0.1 * np.sin(np.arange(32.0))})
+    BollingerBandsStrategy(window=3).backtest_with_metrics(warm_up, initial_capital=1.0)
+    
+    # The parallel grid kernel can't be compiled ahead of time, so warm it up too
+    BollingerBandsStrategy(window=3).optimize(warm_up, window_range=(3, 4), num_std_range=(1.0, 1.0))
+    return True
+
+# Cache downloads across reruns so widget changes don't refetch the same data
+@st.cache_data(ttl=3600)
+def load_data(ticker, start_date, end_date):
+    return fetch_data(ticker, start_date, end_date)
+
 # Run backtest button
 run_button = st.sidebar.button("Run Backtest")
 
-# Function to create static image for backtest results
-def create_backtest_image(positions, signal_points, bb_data, ticker):
+# Altair refuses to embed more than this many rows in a chart by default
+ALTAIR_MAX_ROWS = 5000
+
+# Function to thin a series or DataFrame to at most n_max rows for plotting
+def _downsample(series, n_max=1500):
+    # Round the stride up so the result never exceeds n_max rows
+    return series if len(series) <= n_max else series.iloc[::-(-len(series) // n_max)]
+
+# Function to create the Bollinger Bands chart for backtest results
+def create_bands_chart(bb_data, signal_points, ticker):
     """
-    Create a static matplotlib image for backtest results
+    Create an interactive Altair chart of price, Bollinger Bands and trading signals
     """
-    # Create a figure with 2 subplots
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10), sharex=True, gridspec_kw={'height_ratios': [1, 1.5]})
-    fig.set_facecolor('white')
-    
-    # Plot portfolio value in the first subplot
-    ax1.plot(positions.index, positions['portfolio_value'], 'b-', linewidth=2, label='Portfolio Value')
-    ax1.set_title(f'Portfolio Value Over Time - {ticker}', fontsize=14)
-    ax1.set_ylabel('Portfolio Value ($)', fontsize=12)
-    ax1.grid(True, alpha=0.3)
-    ax1.legend(loc='upper left')
-    
-    # Plot price and Bollinger Bands in the second subplot
-    ax2.plot(bb_data.index, bb_data['Close'], 'k-', linewidth=1.5, label='Close Price')
-    ax2.plot(bb_data.index, bb_data['middle_band'], 'b-', linewidth=1.5, label='Middle Band (SMA)')
-    ax2.plot(bb_data.index, bb_data['upper_band'], 'r-', linewidth=1.5, label='Upper Band')
-    ax2.plot(bb_data.index, bb_data['lower_band'], 'g-', linewidth=1.5, label='Lower Band')
-    
-    # Plot buy signals
-    buy_signals = signal_points[signal_points['signal'] == 1]
-    if not buy_signals.empty:
-        ax2.scatter(buy_signals.index, buy_signals['Close'], 
-                   marker='^', color='green', s=150, label='Buy Signal', zorder=5,
-                   edgecolors='darkgreen', linewidth=1.5)
-    
-    # Plot sell signals
-    sell_signals = signal_points[signal_points['signal'] == -1]
-    if not sell_signals.empty:
-        ax2.scatter(sell_signals.index, sell_signals['Close'], 
-                   marker='v', color='red', s=150, label='Sell Signal', zorder=5,
-                   edgecolors='darkred', linewidth=1.5)
-    
-    ax2.set_title(f'Bollinger Bands Strategy - {ticker}', fontsize=14)
-    ax2.set_ylabel('Price', fontsize=12)
-    ax2.set_xlabel('Date', fontsize=12)
-    ax2.grid(True, alpha=0.3)
-    ax2.legend(loc='upper left')
+    # Long-form price and band series for a single layered line chart
+    band_labels = {
+        'Close': 'Close Price',
+        'middle_band': 'Middle Band (SMA)',
+        'upper_band': 'Upper Band',
+        'lower_band': 'Lower Band'
+    }
+    # The melt below yields one row per band per bar, so keep it under Altair's row limit
+    bands = _downsample(bb_data, ALTAIR_MAX_ROWS // len(band_labels))[list(band_labels)].rename(columns=band_labels)
+    bands = bands.rename_axis('Date').reset_index().melt('Date', var_name='Series', value_name='Price')
     
-    # Format x-axis dates
-    date_format = DateFormatter('%Y-%m-%d')
-    ax2.xaxis.set_major_formatter(date_format)
-    ax2.xaxis.set_major_locator(mdates.AutoDateLocator())
-    fig.autofmt_xdate()
+    lines = alt.Chart(bands).mark_line().encode(
+        x=alt.X('Date:T', title='Date'),
+        y=alt.Y('Price:Q', title='Price', scale=alt.Scale(zero=False)),
+        color=alt.Color('Series:N', title=None,
+                        scale=alt.Scale(domain=list(band_labels.values()),
+                                        range=['black', 'blue', 'red', 'green']))
+    )
     
-    plt.tight_layout()
+    # Buy and sell markers
+    signals = signal_points[['Close', 'signal']].rename_axis('Date').reset_index()
+    signals['Signal'] = np.where(signals['signal'] == 1, 'Buy Signal', 'Sell Signal')
     
-    # Save the figure to a BytesIO object
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-    buf.seek(0)
-    plt.close(fig)
+    points = alt.Chart(signals).mark_point(filled=True, size=150, opacity=1).encode(
+        x='Date:T',
+        y='Close:Q',
+        color=alt.Color('Signal:N', title=None,
+                        scale=alt.Scale(domain=['Buy Signal', 'Sell Signal'], range=['green', 'red'])),
+        shape=alt.Shape('Signal:N', title=None,
+                        scale=alt.Scale(domain=['Buy Signal', 'Sell Signal'],
+                                        range=['triangle-up', 'triangle-down']))
+    )
     
-    return buf
+    return alt.layer(lines, points).resolve_scale(color='independent').properties(
+        title=f'Bollinger Bands Strategy - {ticker}',
+        height=450
+    )
 
 # Function to display performance metrics
 def display_metrics(metrics):
@@ -154,35 +160,45 @@ def display_metrics(metrics):
         st.metric("Maximum Drawdown", f"{metrics['Maximum Drawdown']:.2%}")
         st.metric("Annualized Volatility", f"{metrics['Annualized Volatility']:.2%}")
 
+# CSS for each position status in the positions table
+POSITION_STATUS_STYLES = {
+    'BUY & HOLD': 'background-color: lightgreen; color: darkgreen; font-weight: bold',
+    'HOLDING': 'background-color: #e6ffe6; color: green',
+    'SELL': 'background-color: #ffcccc; color: darkred; font-weight: bold',
+    'OUT OF MARKET': 'background-color: #f2f2f2; color: gray'
+}
+
+# Tables longer than this are shown without styling
+MAX_STYLED_ROWS = 5000
+
 # Function to highlight position status in dataframe
-def highlight_position_status(val):
+def highlight_position_status(col):
     """
-    Highlight position status with colors
+    Highlight a whole position status column with colors in one vectorized pass
     """
-    if val == 'BUY & HOLD':
-        return 'background-color: lightgreen; color: darkgreen; font-weight: bold'
-    elif val == 'HOLDING':
-        return 'background-color: #e6ffe6; color: green'
-    elif val == 'SELL':
-        return 'background-color: #ffcccc; color: darkred; font-weight: bold'
-    elif val == 'OUT OF MARKET':
-        return 'background-color: #f2f2f2; color: gray'
-    return ''
+    return col.map(POSITION_STATUS_STYLES).fillna('')
+
+# Function to encode a DataFrame for download, cached so reruns skip re-encoding
+@st.cache_data(max_entries=8)
+def to_csv_bytes(df):
+    return df.to_csv().encode('utf-8')
 
 # Main app logic
 if run_button:
+    _warm_up_kernels()
+    
     # Show loading spinner
     with st.spinner(f"Fetching data and running backtest for {ticker}..."):
         try:
             # Fetch data
-            data = fetch_data(ticker, start_date_str, end_date_str)
+            data = load_data(ticker, start_date_str, end_date_str)
             
             if data is None or data.empty:
                 st.error(f"No data available for {ticker} between {start_date_str} and {end_date_str}")
             else:
-                # Ensure data is clean
-                data = data.copy()
-                data.dropna(inplace=True)
+                # Ensure data is clean; only Close is used, so skip the dropna copy unless it has gaps
+                if np.isnan(data['Close'].to_numpy()).any():
+                    data = data.dropna(subset=['Close'])
                 
                 # Initialize strategy
                 strategy = BollingerBandsStrategy(window=window, num_std=num_std)
@@ -193,30 +209,18 @@ if run_button:
                     best_window, best_num_std, best_sharpe = strategy.optimize(data)
                     st.success(f"Optimization complete. Best parameters: window={best_window}, num_std={best_num_std:.1f}, Sharpe={best_sharpe:.2f}")
                 
-                # Run backtest
-                positions, signal_points = strategy.backtest(data, initial_capital)
-                
-                # Calculate performance metrics
-                returns = positions['strategy_returns'].dropna()
-                final_capital = positions['portfolio_value'].iloc[-1]
-                metrics = calculate_performance_metrics(initial_capital, final_capital, returns)
+                # Run backtest; positions, bands, signals and metrics all come from one kernel pass
+                positions, signal_points, metrics, bb_data = strategy.backtest_with_metrics(data, initial_capital=initial_capital)
                 
                 # Display metrics
                 st.header("Performance Metrics")
                 display_metrics(metrics)
                 
-                # Prepare data for plotting
-                bb_data = data.copy()
-                bb_data['middle_band'] = bb_data['Close'].rolling(window=strategy.window).mean()
-                bb_data['std'] = bb_data['Close'].rolling(window=strategy.window).std()
-                bb_data['upper_band'] = bb_data['middle_band'] + (bb_data['std'] * strategy.num_std)
-                bb_data['lower_band'] = bb_data['middle_band'] - (bb_data['std'] * strategy.num_std)
-                bb_data = bb_data.dropna().copy()
-                
-                # Create and display static image
+                # Display interactive charts
                 st.header("Backtest Results")
-                img_buf = create_backtest_image(positions, signal_points, bb_data, ticker)
-                st.image(img_buf, use_container_width=True)
+                st.subheader(f"Portfolio Value Over Time - {ticker}")
+                st.line_chart(positions['portfolio_value'])
+                st.altair_chart(create_bands_chart(bb_data, signal_points, ticker), use_container_width=True)
                 
                 # Display positions table with highlighted position status
                 st.header("Trading Positions")
@@ -225,12 +229,14 @@ if run_button:
                 display_cols = ['price', 'signal', 'position', 'position_status', 
                                'strategy_returns', 'portfolio_value', 'holdings', 'cash']
                 
-                # Apply styling to highlight position status
-                styled_positions = positions[display_cols].style.map(
-                    highlight_position_status, subset=['position_status']
-                )
-                
-                st.dataframe(styled_positions)
+                # Apply styling to highlight position status; Styler is slow on long tables
+                if len(positions) > MAX_STYLED_ROWS:
+                    st.dataframe(positions[display_cols])
+                else:
+                    styled_positions = positions[display_cols].style.apply(
+                        highlight_position_status, subset=['position_status']
+                    )
+                    st.dataframe(styled_positions)
                 
                 # Display trade summary
                 st.header("Trade Summary")
@@ -250,7 +256,7 @@ if run_button:
                 # Download buttons
                 col1, col2 = st.columns(2)
                 with col1:
-                    csv = positions.to_csv().encode('utf-8')
+                    csv = to_csv_bytes(positions)
                     st.download_button(
                         label="Download Results as CSV",
                         data=csv,
@@ -301,57 +307,84 @@ with col5:
 # Run comparison button
 compare_button = st.button("Run Comparison")
 
-# Function to create comparison image
-def create_comparison_image(portfolio_values, ticker):
+# Shared figure for comparison plots, kept alive across reruns and sessions
+@st.cache_resource
+def _get_comparison_figure():
     """
-    Create a static matplotlib image for strategy comparison
+    Create the reusable comparison figure, its axes and a lock guarding them
     """
-    fig, ax = plt.subplots(figsize=(12, 6))
-    fig.set_facecolor('white')
-    
-    # Define a list of colors for different strategies
-    colors = ['blue', 'green', 'red', 'purple', 'orange']
+    # matplotlib is only needed for the comparison image, so import it lazily
+    import matplotlib
+    from matplotlib.figure import Figure
     
-    for i, column in enumerate(portfolio_values.columns):
-        color_idx = i % len(colors)
-        ax.plot(portfolio_values.index, portfolio_values[column], 
-                color=colors[color_idx], linewidth=2, label=column)
+    # Let matplotlib merge nearly collinear segments when drawing long series
+    matplotlib.rcParams['path.simplify'] = True
+    matplotlib.rcParams['path.simplify_threshold'] = 1.0
     
-    ax.set_title(f'Strategy Comparison - {ticker}', fontsize=14)
-    ax.set_xlabel('Date', fontsize=12)
-    ax.set_ylabel('Portfolio Value ($)', fontsize=12)
-    ax.grid(True, alpha=0.3)
-    ax.legend(loc='upper left')
+    fig = Figure(figsize=(12, 6))
+    fig.set_facecolor('white')
+    ax = fig.subplots()
+    return fig, ax, threading.Lock()
+
+# Function to create comparison image
+@st.cache_data(max_entries=8)
+def create_comparison_image(portfolio_values, ticker):
+    """
+    Create a static matplotlib image for strategy comparison, returned as PNG bytes.
+    Cached so reruns with unchanged inputs skip rendering.
+    """
+    import matplotlib.dates as mdates
     
-    # Format x-axis dates
-    date_format = DateFormatter('%Y-%m-%d')
-    ax.xaxis.set_major_formatter(date_format)
-    ax.xaxis.set_major_locator(mdates.AutoDateLocator())
-    fig.autofmt_xdate()
+    fig, ax, lock = _get_comparison_figure()
     
-    plt.tight_layout()
+    # Thin long series before plotting
+    portfolio_values = _downsample(portfolio_values)
     
-    # Save the figure to a BytesIO object
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-    buf.seek(0)
-    plt.close(fig)
+    with lock:
+        # Clear the previous render
+        ax.cla()
+        
+        # Define a list of colors for different strategies
+        colors = ['blue', 'green', 'red', 'purple', 'orange']
+        
+        for i, column in enumerate(portfolio_values.columns):
+            color_idx = i % len(colors)
+            ax.plot(portfolio_values.index, portfolio_values[column], 
+                    color=colors[color_idx], linewidth=2, label=column)
+        
+        ax.set_title(f'Strategy Comparison - {ticker}', fontsize=14)
+        ax.set_xlabel('Date', fontsize=12)
+        ax.set_ylabel('Portfolio Value ($)', fontsize=12)
+        ax.grid(True, alpha=0.3)
+        ax.legend(loc='upper left')
+        
+        # Format x-axis dates
+        date_format = mdates.DateFormatter('%Y-%m-%d')
+        ax.xaxis.set_major_formatter(date_format)
+        ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+        fig.autofmt_xdate()
+        
+        fig.tight_layout()
+        
+        # Render the figure to PNG bytes
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', dpi=80)
     
-    return buf
+    return buf.getvalue()
 
 # Run comparison logic
 if compare_button:
     with st.spinner(f"Running comparison for {compare_ticker}..."):
         try:
             # Fetch data
-            data = fetch_data(compare_ticker, compare_start_date_str, compare_end_date_str)
+            data = load_data(compare_ticker, compare_start_date_str, compare_end_date_str)
             
             if data is None or data.empty:
                 st.error(f"No data available for {compare_ticker} between {compare_start_date_str} and {compare_end_date_str}")
             else:
-                # Ensure data is clean
-                data = data.copy()
-                data.dropna(inplace=True)
+                # Ensure data is clean; only Close is used, so skip the dropna copy unless it has gaps
+                if np.isnan(data['Close'].to_numpy()).any():
+                    data = data.dropna(subset=['Close'])
                 
                 # Create list of strategies to compare
                 strategies = []
@@ -369,46 +402,43 @@ if compare_button:
                 if not strategies:
                     st.warning("Please select at least one strategy configuration to compare.")
                 else:
-                    # Run backtest for each strategy
+                    # Run every backtest in one batch so the rolling statistics are shared per window
+                    backtests = BollingerBandsStrategy.batch_backtest(data, strategies, initial_capital)
+                    
+                    # Portfolio values of all strategies side by side (bars x strategies)
                     results = []
-                    portfolio_values = pd.DataFrame(index=data.index)
+                    pv = np.full((len(data), len(backtests)), np.nan)
                     
                     for strategy_config in strategies:
                         name = strategy_config['name']
-                        window = strategy_config['window']
-                        num_std = strategy_config['num_std']
+                        if name not in backtests:
+                            st.error(f"Backtest failed for strategy {name}")
+                            continue
+                        positions, signal_points, _ = backtests[name]
                         
-                        st.text(f"Running backtest for strategy: {name}")
-                        strategy = BollingerBandsStrategy(window=window, num_std=num_std)
+                        # Positions start after the warm-up window, so align them to the last rows
+                        pv[-len(positions):, len(results)] = positions['portfolio_value'].to_numpy()
                         
-                        try:
-                            positions, signal_points = strategy.backtest(data, initial_capital)
-                            
-                            # Calculate performance metrics
-                            returns = positions['strategy_returns'].dropna()
-                            final_capital = positions['portfolio_value'].iloc[-1]
-                            metrics = calculate_performance_metrics(initial_capital, final_capital, returns)
-                            
-                            # Add to results
-                            metrics['name'] = name
-                            metrics['window'] = window
-                            metrics['num_std'] = num_std
-                            metrics['final_capital'] = final_capital
-                            metrics['trades'] = len(positions[positions['position_status'] == 'BUY & HOLD'])
-                            metrics['market_exposure'] = positions['position'].mean()
-                            results.append(metrics)
-                            
-                            # Add portfolio value to comparison DataFrame
-                            portfolio_values[name] = positions['portfolio_value']
-                        except Exception as e:
-                            st.error(f"Error running backtest for strategy {name}: {e}")
-                            continue
+                        # Add to results
+                        results.append({
+                            'name': name,
+                            'window': strategy_config['window'],
+                            'num_std': strategy_config['num_std'],
+                            'final_capital': positions['portfolio_value'].iloc[-1],
+                            'trades': len(positions[positions['position_status'] == 'BUY & HOLD']),
+                            'market_exposure': positions['position'].mean()
+                        })
                     
                     if not results:
                         st.error("No successful backtests. Please try different parameters.")
                     else:
-                        # Create results DataFrame
-                        results_df = pd.DataFrame(results)
+                        # Calculate performance metrics for all strategies at once
+                        metrics = calculate_performance_metrics_matrix(initial_capital, pv)
+                        
+                        # Create results and portfolio value DataFrames
+                        results_df = pd.concat([pd.DataFrame(metrics), pd.DataFrame(results)], axis=1)
+                        portfolio_values = pd.DataFrame(pv, index=data.index,
+                                                        columns=[r['name'] for r in results])
                         
                         # Display results
                         st.subheader("Comparison Results")
@@ -417,11 +447,11 @@ if compare_button:
                                                'trades', 'market_exposure']])
                         
                         # Create and display static image
-                        img_buf = create_comparison_image(portfolio_values, compare_ticker)
-                        st.image(img_buf, use_container_width=True)
+                        img_bytes = create_comparison_image(portfolio_values, compare_ticker)
+                        st.image(img_bytes, use_container_width=True)
                         
                         # Download button
-                        csv = results_df.to_csv().encode('utf-8')
+                        csv = to_csv_bytes(results_df)
                         st.download_button(
                             label="Download Comparison Results as CSV",
                             data=csv,
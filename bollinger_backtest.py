@@ -4,7 +4,7 @@ import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 import argparse
 
-from utils import fetch_data, plot_bollinger_bands, calculate_performance_metrics, print_performance_metrics
+from utils import fetch_data, plot_bollinger_bands, print_performance_metrics
 from bollinger_strategy import BollingerBandsStrategy
 
 def run_backtest(ticker, start_date, end_date, initial_capital=10000.0, window=20, num_std=2, optimize=False):
@@ -38,9 +38,9 @@ def run_backtest(ticker, start_date, end_date, initial_capital=10000.0, window=2
     
     print(f"Data fetched successfully. {len(data)} data points.")
     
-    # Ensure data is clean and properly formatted
-    data = data.copy()
-    data.dropna(inplace=True)
+    # Ensure data is clean; only Close is used, so skip the dropna copy unless it has gaps
+    if np.isnan(data['Close'].to_numpy()).any():
+        data = data.dropna(subset=['Close'])
     
     # Initialize strategy
     strategy = BollingerBandsStrategy(window=window, num_std=num_std)
@@ -51,14 +51,12 @@ def run_backtest(ticker, start_date, end_date, initial_capital=10000.0, window=2
         best_window, best_num_std, best_sharpe = strategy.optimize(data)
         print(f"Optimization complete. Best parameters: window={best_window}, num_std={best_num_std:.1f}, Sharpe={best_sharpe:.2f}")
     
-    # Run backtest
+    # Run backtest; positions, bands, signals and metrics all come from one kernel pass
     print("Running backtest...")
-    positions, signal_points = strategy.backtest(data, initial_capital)
+    positions, signal_points, metrics, bb_data = strategy.backtest_with_metrics(data, initial_capital=initial_capital)
     
-    # Calculate performance metrics
-    returns = positions['strategy_returns'].dropna()
-    final_capital = positions['portfolio_value'].iloc[-1]
-    metrics = calculate_performance_metrics(initial_capital, final_capital, returns)
+    if metrics is None:
+        return
     
     # Print performance metrics
     print_performance_metrics(metrics)
@@ -76,14 +74,6 @@ def run_backtest(ticker, start_date, end_date, initial_capital=10000.0, window=2
     
     # Plot Bollinger Bands with signals
     plt.subplot(2, 1, 2)
-    bb_data = data.copy()
-    bb_data['middle_band'] = bb_data['Close'].rolling(window=strategy.window).mean()
-    bb_data['std'] = bb_data['Close'].rolling(window=strategy.window).std()
-    bb_data['upper_band'] = bb_data['middle_band'] + (bb_data['std'] * strategy.num_std)
-    bb_data['lower_band'] = bb_data['middle_band'] - (bb_data['std'] * strategy.num_std)
-    
-    # Ensure data is aligned
-    bb_data = bb_data.dropna().copy()
     
     # Plot price and bands
     plt.plot(bb_data.index, bb_data['Close'], label='Close Price', alpha=0.5)
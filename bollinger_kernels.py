@@ -0,0 +1,289 @@
+"""
+Numba-compiled kernels for the Bollinger Bands strategy.
+
+These functions operate on raw NumPy arrays of closing prices and replace the
+pandas rolling/apply path with single-pass loops compiled to native code.
+"""
+
+import os
+
+import numpy as np
+from numba import config as numba_config, njit, prange
+
+# Persist compiled kernels in a project-local cache so they survive restarts
+os.environ.setdefault(
+    'NUMBA_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.numba_cache')
+)
+# Parallel kernels are called from Streamlit's script thread; prefer the
+# OpenMP/workqueue layers over TBB, which can hang at exit in that case
+os.environ.setdefault('NUMBA_THREADING_LAYER_PRIORITY', 'omp workqueue tbb')
+
+# numba reads the environment once when it is first imported, which may have
+# happened before this module, so apply the settings to its config directly;
+# the kernels below pick up the cache directory when they are decorated
+numba_config.CACHE_DIR = os.environ['NUMBA_CACHE_DIR']
+numba_config.THREADING_LAYER_PRIORITY = os.environ['NUMBA_THREADING_LAYER_PRIORITY'].split()
+
+# Running sums are recomputed from scratch this often to stop rounding error
+# from accumulating over long series
+RESEED_INTERVAL = 4096
+
+
+@njit(cache=True, fastmath=True)
+def rolling_mean_std(close, window):
+    """
+    Compute the rolling mean and standard deviation of a price series.
+
+    Uses a running sum and running sum of squares, so each step is O(1)
+    regardless of the window size. The sums are re-seeded every
+    RESEED_INTERVAL bars, so rounding error relative to an exact sliding-window
+    std does not grow with the series length. pandas' rolling std accumulates
+    more error on long series, so the two can differ slightly. The
+    standard deviation is the sample (ddof=1) estimate, matching pandas'
+    rolling std. Prices may be float32 to halve the memory traffic; the sums
+    are always accumulated in float64.
+
+    Parameters:
+    -----------
+    close : numpy.ndarray
+        1-D float32 or float64 array of closing prices
+    window : int
+        Window size for the moving average
+
+    Returns:
+    --------
+    tuple
+        (rolling mean, rolling standard deviation), NaN for the first window-1 bars
+    """
+    n = close.shape[0]
+    mean = np.full(n, np.nan)
+    std = np.full(n, np.nan)
+
+    if n == 0:
+        return mean, std
+
+    # Sums are taken around a reference price, which keeps them small and
+    # avoids cancellation when the spread is tiny relative to the price level
+    ref = np.float64(close[0])
+    s = 0.0
+    ss = 0.0
+    for i in range(n):
+        if i >= window and i % RESEED_INTERVAL == 0:
+            # Fresh sums over the current window, around its latest price
+            ref = np.float64(close[i])
+            s = 0.0
+            ss = 0.0
+            for k in range(i - window + 1, i + 1):
+                d = np.float64(close[k]) - ref
+                s += d
+                ss += d * d
+        else:
+            d = np.float64(close[i]) - ref
+            s += d
+            ss += d * d
+            if i >= window:
+                old = np.float64(close[i - window]) - ref
+                s -= old
+                ss -= old * old
+        if i >= window - 1:
+            m = s / window
+            var = (ss - window * m * m) / (window - 1)
+            mean[i] = ref + m
+            std[i] = np.sqrt(max(var, 0.0))
+
+    return mean, std
+
+
+@njit(cache=True)
+def _crossover_step(price, upper, lower, prev_below, prev_above, position):
+    """
+    Advance the crossover state machine by one bar.
+
+    A sell signal fires when the price was above the upper band on the previous
+    bar and no longer is, a buy signal when it was below the lower band and no
+    longer is; a sell takes precedence. Positions are long-only (0 or 1).
+    Returns (signal, below, above, position) for this bar.
+    """
+    below = price < lower
+    above = price > upper
+    signal = 0
+    if prev_above and not above:
+        signal = -1
+    elif prev_below and not below:
+        signal = 1
+
+    if signal == 1 and position == 0:
+        position = 1
+    elif signal == -1 and position == 1:
+        position = 0
+    return signal, below, above, position
+
+
+@njit(cache=True, fastmath=True)
+def bb_backtest(close, mid, std, window, num_std, initial_capital):
+    """
+    Run the full backtest in one pass, accumulating performance statistics.
+
+    Signals and positions come from _crossover_step: a buy signal fires when
+    the price moves back above the lower band, a sell signal when it moves
+    back below the upper band, and positions are long-only (0 or 1). The
+    daily strategy returns are summarized in the same loop that compounds the
+    portfolio value, so no second pass is needed to compute the metrics.
+
+    Parameters:
+    -----------
+    close : numpy.ndarray
+        1-D float64 array of closing prices
+    mid : numpy.ndarray
+        Rolling mean aligned with close, as returned by rolling_mean_std
+    std : numpy.ndarray
+        Rolling standard deviation aligned with close
+    window : int
+        Window size the statistics were computed with
+    num_std : float
+        Number of standard deviations for bands
+    initial_capital : float
+        Initial investment amount
+
+    Returns:
+    --------
+    tuple
+        (upper, lower, signal, position, portfolio_value, summary); bars before
+        the first full window have NaN bands and portfolio value. summary holds
+        (final value, number of returns, mean return, sample std of returns,
+        number of positive returns, maximum drawdown), the arguments expected
+        by utils.performance_metrics_from_summary
+    """
+    n = close.shape[0]
+    upper = mid + num_std * std
+    lower = mid - num_std * std
+    signal = np.zeros(n, dtype=np.int8)
+    position = np.zeros(n, dtype=np.int8)
+    pv = np.full(n, np.nan)
+    summary = np.zeros(6)
+    summary[0] = initial_capital
+
+    start = window - 1
+    if start >= n:
+        return upper, lower, signal, position, pv, summary
+
+    prev_below = False
+    prev_above = False
+    current_position = 0
+    value = initial_capital
+    peak = initial_capital
+    max_drawdown = 0.0
+    sum_r = 0.0
+    sum_r2 = 0.0
+    n_wins = 0
+    for i in range(start, n):
+        # Portfolio value uses the position held coming into this bar
+        r = 0.0
+        if i > start and current_position == 1:
+            r = close[i] / close[i - 1] - 1
+            value *= close[i] / close[i - 1]
+        pv[i] = value
+
+        sum_r += r
+        sum_r2 += r * r
+        if r > 0:
+            n_wins += 1
+        if value > peak:
+            peak = value
+        max_drawdown = min(max_drawdown, value / peak - 1)
+
+        # Crossings relative to the previous bar; the first bar starts inside the bands
+        signal[i], prev_below, prev_above, current_position = _crossover_step(
+            close[i], upper[i], lower[i], prev_below, prev_above, current_position
+        )
+        position[i] = current_position
+
+    n_returns = n - start
+    mean_r = sum_r / n_returns
+    summary[0] = value
+    summary[1] = n_returns
+    summary[2] = mean_r
+    if n_returns > 1:
+        var_r = (sum_r2 - n_returns * mean_r * mean_r) / (n_returns - 1)
+        summary[3] = np.sqrt(max(var_r, 0.0))
+    else:
+        summary[3] = np.nan
+    summary[4] = n_wins
+    summary[5] = max_drawdown
+
+    return upper, lower, signal, position, pv, summary
+
+
+@njit(cache=True)
+def _sharpe_for_bands(close, mid, std, window, num_std):
+    """
+    Annualized Sharpe ratio of the strategy for one num_std given rolling statistics.
+
+    Runs the same crossover state machine as bb_backtest, keeping only
+    the daily strategy returns. Returns -inf when the ratio is undefined.
+    """
+    n = close.shape[0]
+    start = window - 1
+    n_returns = n - start
+    if n_returns < 2:
+        return -np.inf
+
+    returns = np.zeros(n_returns)
+    prev_below = False
+    prev_above = False
+    current_position = 0
+    for i in range(start, n):
+        # Return earned on the position held coming into this bar
+        if i > start and current_position == 1:
+            returns[i - start] = close[i] / close[i - 1] - 1
+
+        _, prev_below, prev_above, current_position = _crossover_step(
+            close[i], mid[i] + num_std * std[i], mid[i] - num_std * std[i],
+            prev_below, prev_above, current_position
+        )
+
+    mean = returns.mean()
+    ss = 0.0
+    for k in range(n_returns):
+        ss += (returns[k] - mean) ** 2
+    returns_std = np.sqrt(ss / (n_returns - 1))
+    if not returns_std > 0:
+        return -np.inf
+
+    return mean / returns_std * np.sqrt(252.0)
+
+
+@njit(cache=True, parallel=True)
+def optimize_grid(close, windows, mids, stds, num_stds):
+    """
+    Compute Sharpe ratios over a (window, num_std) parameter grid in parallel.
+
+    Windows are distributed across threads; each reuses its precomputed
+    rolling statistics for every num_std.
+
+    Parameters:
+    -----------
+    close : numpy.ndarray
+        1-D float64 array of closing prices
+    windows : numpy.ndarray
+        Window sizes to test
+    mids : numpy.ndarray
+        Rolling means of shape (len(windows), len(close)), one row per window
+    stds : numpy.ndarray
+        Rolling standard deviations of shape (len(windows), len(close))
+    num_stds : numpy.ndarray
+        Numbers of standard deviations to test
+
+    Returns:
+    --------
+    numpy.ndarray
+        Sharpe ratios of shape (len(windows), len(num_stds)), -inf where undefined
+    """
+    out = np.full((windows.shape[0], num_stds.shape[0]), -np.inf)
+    for i in prange(windows.shape[0]):
+        window = windows[i]
+        if window < 2:
+            continue
+        for j in range(num_stds.shape[0]):
+            out[i, j] = _sharpe_for_bands(close, mids[i], stds[i], window, num_stds[j])
+    return out
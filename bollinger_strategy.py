@@ -1,6 +1,58 @@
 import pandas as pd
 import numpy as np
 
+from bollinger_kernels import optimize_grid
+from numba import config as numba_config, get_num_threads, set_num_threads
+
+from utils import performance_metrics_from_summary
+
+# Prefer the ahead-of-time compiled kernels (see build_kernels.py) to skip JIT warm-up
+try:
+    from bollinger_kernels_aot import bb_backtest, rolling_mean_std
+except ImportError:
+    from bollinger_kernels import bb_backtest, rolling_mean_std
+
+# TA-Lib is optional; when installed its C SMA/STDDEV compute the band statistics
+try:
+    import talib
+    _HAS_TALIB = True
+except ImportError:
+    _HAS_TALIB = False
+
+def rolling_stats(close, window):
+    """
+    Compute the rolling mean and standard deviation behind the bands.
+    
+    Every band consumer (signals, backtests and the optimizer) goes through
+    this function, so they all use the same implementation: TA-Lib when it is
+    installed, otherwise the compiled rolling_mean_std kernel. The kernel reads
+    the prices as float32, which holds more significant digits than quoted
+    prices carry and halves the memory traffic of the rolling pass; it still
+    accumulates in float64. TA-Lib only accepts float64.
+    
+    Parameters:
+    -----------
+    close : numpy.ndarray
+        1-D contiguous float64 array of closing prices
+    window : int
+        Window size for the moving average, at least 2
+        
+    Returns:
+    --------
+    tuple
+        (rolling mean, rolling sample standard deviation), NaN for the first window-1 bars
+    """
+    if window < 2:
+        raise ValueError(f"window must be at least 2 to compute a standard deviation, got {window}")
+    
+    if _HAS_TALIB:
+        # TA-Lib uses the population std; rescale to the sample std
+        mid = talib.SMA(close, timeperiod=window)
+        std = talib.STDDEV(close, timeperiod=window, nbdev=1.0) * np.sqrt(window / (window - 1))
+        return mid, std
+    
+    return rolling_mean_std(np.ascontiguousarray(close, dtype=np.float32), window)
+
 class BollingerBandsStrategy:
     """
     A trading strategy based on Bollinger Bands.
@@ -25,67 +77,60 @@ class BollingerBandsStrategy:
         self.window = window
         self.num_std = num_std
     
-    def generate_signals(self, data):
+    def generate_signals(self, data, bands=None):
         """
         Generate trading signals based on Bollinger Bands.
         
         Parameters:
         -----------
         data : pandas.DataFrame
-            DataFrame containing price data with 'Close' column
+            DataFrame containing price data with 'Close' column, without missing values
+        bands : dict, optional
+            Precomputed rolling statistics for this window with 'mid' and 'std'
+            arrays, as returned by rolling_stats (default: None, computed here)
             
         Returns:
         --------
         pandas.DataFrame
             DataFrame with added signal column (1 for buy, -1 for sell/exit, 0 for hold)
         """
-        # Make a copy of the data to avoid modifying the original
-        data_copy = data.copy()
-        
-        # Calculate the middle band (SMA)
-        middle_band = data_copy['Close'].rolling(window=self.window).mean()
-        
-        # Calculate the standard deviation
-        std = data_copy['Close'].rolling(window=self.window).std()
-        
-        # Calculate upper and lower bands
-        upper_band = middle_band + (std * self.num_std)
-        lower_band = middle_band - (std * self.num_std)
-        
-        # Create a new DataFrame with all the necessary columns
-        df = pd.DataFrame(index=data_copy.index)
-        df['Close'] = data_copy['Close']
-        df['middle_band'] = middle_band
-        df['upper_band'] = upper_band
-        df['lower_band'] = lower_band
-        
-        # Drop NaN values resulting from the rolling window
-        df = df.dropna()
-        
-        # Initialize signal column
-        df['signal'] = 0
-        
-        # Create boolean series for price below lower band and above upper band
-        below_lower = (df['Close'] < df['lower_band']).astype(bool)
-        above_upper = (df['Close'] > df['upper_band']).astype(bool)
-        
-        # Shift to get previous state (avoiding fillna warning)
-        was_below_lower = below_lower.shift(1)
-        was_above_upper = above_upper.shift(1)
-        
-        # First value will be NaN, set it to False
-        was_below_lower.loc[was_below_lower.index[0]] = False
-        was_above_upper.loc[was_above_upper.index[0]] = False
-        
-        # Generate buy signals: price was below lower band and now is not
-        buy_condition = (was_below_lower) & (~below_lower)
-        df.loc[buy_condition, 'signal'] = 1
-        
-        # Generate sell signals: price was above upper band and now is not
-        sell_condition = (was_above_upper) & (~above_upper)
-        df.loc[sell_condition, 'signal'] = -1
+        signals, _, _, _ = self._run_kernel(data, bands, 1.0)
+        return signals
+    
+    def _run_kernel(self, data, bands, initial_capital):
+        """
+        Run the bb_backtest kernel and slice off the warm-up bars.
         
-        return df
+        Returns the signals DataFrame (close, bands and signal per bar) along
+        with the position and portfolio value arrays aligned with it and the
+        kernel's return statistics summary.
+        """
+        close = np.ascontiguousarray(data['Close'].to_numpy(dtype=np.float64))
+        
+        # Calculate the rolling statistics unless they were precomputed
+        if bands is None:
+            mid, std = rolling_stats(close, self.window)
+        else:
+            mid, std = bands['mid'], bands['std']
+        
+        # Bands, signals, positions, portfolio value and return statistics in one pass
+        upper, lower, signal, position, portfolio_value, summary = bb_backtest(
+            close, mid, std, self.window, float(self.num_std), float(initial_capital)
+        )
+        
+        # Skip the first window-1 bars, whose bands are undefined, by slicing
+        # rather than building the full frame and dropping NaN rows
+        start = min(max(self.window - 1, 0), len(close))
+        
+        signals = pd.DataFrame({
+            'Close': close[start:],
+            'middle_band': mid[start:],
+            'upper_band': upper[start:],
+            'lower_band': lower[start:],
+            'signal': signal[start:]
+        }, index=data.index[start:])
+        
+        return signals, position[start:], portfolio_value[start:], summary
     
     def backtest(self, data, initial_capital=10000.0):
         """
@@ -103,79 +148,140 @@ class BollingerBandsStrategy:
         tuple
             (DataFrame with portfolio value and positions, DataFrame with signals)
         """
-        # Generate signals
-        signals = self.generate_signals(data)
+        positions, signal_points, _, _ = self.backtest_with_metrics(data, None, initial_capital)
+        return positions, signal_points
+    
+    def backtest_with_metrics(self, data, bands=None, initial_capital=10000.0):
+        """
+        Backtest the strategy and compute its performance metrics in one pass.
+        
+        Signals, positions, portfolio value and the return statistics behind
+        the metrics all come from a single bb_backtest kernel call, so the
+        metrics always describe the positions that are returned.
+        
+        Parameters:
+        -----------
+        data : pandas.DataFrame
+            DataFrame containing price data with 'Close' column, without missing values
+        bands : dict, optional
+            Rolling statistics for this window with 'mid' and 'std' arrays,
+            as returned by rolling_stats (default: None, computed here)
+        initial_capital : float, optional
+            Initial investment amount (default: 10000.0)
+            
+        Returns:
+        --------
+        tuple
+            (DataFrame with portfolio value and positions, DataFrame with signals,
+            dictionary of performance metrics, DataFrame with the close price,
+            bands and signal for every bar, as from generate_signals); empty
+            DataFrames and None metrics when the data is shorter than the window
+        """
+        # Bands, signals, positions, portfolio value and return statistics in one pass
+        signals, position, portfolio_value, summary = self._run_kernel(data, bands, initial_capital)
         
         if signals.empty:
             print("No signals generated. Check your data and parameters.")
-            return pd.DataFrame(), pd.DataFrame()
+            return pd.DataFrame(), pd.DataFrame(), None, signals
+        
+        price = signals['Close'].to_numpy()
+        signal = signals['signal'].to_numpy()
+        prev_position = np.zeros_like(position)
+        prev_position[1:] = position[:-1]
+        
+        # Position status for clearer indication of trading activity
+        position_status = np.select(
+            [(signal == 1) & (prev_position == 0), (signal == -1) & (prev_position == 1), position == 1],
+            ['BUY & HOLD', 'SELL', 'HOLDING'],
+            default='OUT OF MARKET'
+        )
+        
+        # Calculate daily returns, with 0 for the first day
+        returns = np.empty_like(price)
+        returns[0] = 0
+        returns[1:] = price[1:] / price[:-1] - 1
+        
+        # Calculate holdings and cash, with shares bought at the initial price
+        share_size = initial_capital / price[0]
+        holdings = position * price * share_size
+        
+        # Create a DataFrame for positions and portfolio value in one go
+        positions = pd.DataFrame({
+            'price': price,
+            'signal': signal,
+            'position': position,
+            'position_status': position_status,
+            'returns': returns,
+            'strategy_returns': returns * prev_position,
+            'portfolio_value': portfolio_value,
+            'holdings': holdings,
+            'cash': portfolio_value - holdings
+        }, index=signals.index)
         
-        # Create a DataFrame for positions and portfolio value
-        positions = pd.DataFrame(index=signals.index).copy()
-        positions['price'] = signals['Close']
-        positions['signal'] = signals['signal']
+        # Filter signals for visualization
+        signal_points = signals[signal != 0]
         
-        # Initialize position column
-        positions['position'] = 0
+        metrics = performance_metrics_from_summary(initial_capital, *summary)
         
-        # Initialize position_status column for clearer indication of trading activity
-        positions['position_status'] = 'OUT OF MARKET'
+        return positions, signal_points, metrics, signals
+    
+    @classmethod
+    def batch_backtest(cls, data, configs, initial_capital=10000.0):
+        """
+        Backtest several strategy configurations on the same price data.
         
-        # Calculate positions (shares held) - No shorting allowed (only 0 or 1)
-        current_position = 0
-        for i in range(len(positions)):
-            signal = positions['signal'].iloc[i]
-            
-            # Buy signal and not already in a position
-            if signal == 1 and current_position == 0:
-                current_position = 1
-                positions.loc[positions.index[i], 'position'] = current_position
-                positions.loc[positions.index[i], 'position_status'] = 'BUY & HOLD'
-            # Sell signal and currently in a position
-            elif signal == -1 and current_position == 1:
-                current_position = 0
-                positions.loc[positions.index[i], 'position'] = current_position
-                positions.loc[positions.index[i], 'position_status'] = 'SELL'
-            # No signal but in a position
-            elif current_position == 1:
-                positions.loc[positions.index[i], 'position'] = current_position
-                positions.loc[positions.index[i], 'position_status'] = 'HOLDING'
-            # No signal and not in a position
-            else:
-                positions.loc[positions.index[i], 'position'] = current_position
-                positions.loc[positions.index[i], 'position_status'] = 'OUT OF MARKET'
-        
-        # Calculate daily returns
-        returns = positions['price'].pct_change()
-        # Replace NaN values with 0 for the first day
-        returns.loc[returns.index[0]] = 0
-        positions['returns'] = returns
-        
-        # Calculate strategy returns (only when we have a position)
-        prev_position = positions['position'].shift(1).fillna(0)
-        positions['strategy_returns'] = positions['returns'] * prev_position
-        
-        # Calculate portfolio value
-        cumulative_returns = (1 + positions['strategy_returns']).cumprod()
-        positions['portfolio_value'] = initial_capital * cumulative_returns
-        
-        # Calculate number of shares based on initial price
-        initial_price = positions['price'].iloc[0]
-        share_size = initial_capital / initial_price
-        
-        # Calculate holdings and cash
-        positions['holdings'] = positions['position'] * positions['price'] * share_size
-        positions['cash'] = positions['portfolio_value'] - positions['holdings']
+        The close prices are read once and the rolling statistics are computed
+        once per distinct window, then shared by every configuration using it.
         
-        # Filter signals for visualization
-        signal_points = signals[signals['signal'] != 0].copy()
+        Parameters:
+        -----------
+        data : pandas.DataFrame
+            DataFrame containing price data with 'Close' column
+        configs : list
+            List of dictionaries with 'name', 'window' and 'num_std' keys
+        initial_capital : float, optional
+            Initial investment amount (default: 10000.0)
+            
+        Returns:
+        --------
+        dict
+            Mapping of configuration name to (positions, signal_points, metrics);
+            failed configurations are reported and left out
+        """
+        close = np.ascontiguousarray(data['Close'].to_numpy(dtype=np.float64))
+        
+        # Rolling statistics depend only on the window, so compute them once per distinct window
+        window_stats = {}
+        
+        results = {}
+        for config in configs:
+            name = config['name']
+            window = config['window']
+            strategy = cls(window=window, num_std=config['num_std'])
+            try:
+                if window not in window_stats:
+                    mid, std = rolling_stats(close, window)
+                    window_stats[window] = {'mid': mid, 'std': std}
+                positions, signal_points, metrics, _ = strategy.backtest_with_metrics(
+                    data, window_stats[window], initial_capital
+                )
+            except Exception as e:
+                print(f"Error running backtest for strategy {name}: {e}")
+                continue
+            
+            if not positions.empty:
+                results[name] = (positions, signal_points, metrics)
         
-        return positions, signal_points
+        return results
     
-    def optimize(self, data, window_range=(10, 30), num_std_range=(1.5, 2.5), step_size=0.1):
+    def optimize(self, data, window_range=(10, 30), num_std_range=(1.5, 2.5), step_size=0.1, n_jobs=-1):
         """
         Optimize strategy parameters using grid search.
         
+        The rolling statistics are computed once per window with rolling_stats,
+        then the whole grid is scored by a Numba kernel that spreads windows
+        across threads and reuses each window's statistics for every num_std.
+        
         Parameters:
         -----------
         data : pandas.DataFrame
@@ -186,48 +292,51 @@ class BollingerBandsStrategy:
             Range of standard deviation values to test (default: (1.5, 2.5))
         step_size : float, optional
             Step size for standard deviation values (default: 0.1)
+        n_jobs : int, optional
+            Number of threads, -1 for all cores and -2 for all but one, as in
+            joblib (default: -1)
             
         Returns:
         --------
         tuple
             (optimal window size, optimal number of standard deviations, best Sharpe ratio)
         """
-        best_sharpe = -np.inf
-        best_window = None
-        best_num_std = None
-        
         # Create ranges for grid search
-        window_sizes = range(window_range[0], window_range[1] + 1)
+        window_sizes = np.arange(window_range[0], window_range[1] + 1, dtype=np.int64)
         num_stds = np.arange(num_std_range[0], num_std_range[1] + step_size, step_size)
         
-        for window in window_sizes:
-            for num_std in num_stds:
-                # Update parameters
-                self.window = window
-                self.num_std = num_std
-                
-                try:
-                    # Run backtest
-                    positions, _ = self.backtest(data)
-                    
-                    if positions.empty:
-                        continue
-                    
-                    # Calculate Sharpe ratio
-                    if 'strategy_returns' in positions.columns and not positions['strategy_returns'].empty:
-                        returns = positions['strategy_returns'].dropna()
-                        if len(returns) > 0 and returns.std() > 0:
-                            sharpe = (returns.mean() / returns.std()) * np.sqrt(252)
-                            
-                            if sharpe > best_sharpe:
-                                best_sharpe = sharpe
-                                best_window = window
-                                best_num_std = num_std
-                except Exception as e:
-                    print(f"Error during optimization with window={window}, num_std={num_std}: {e}")
-                    continue
-        
-        if best_window is None or best_num_std is None:
+        close = np.ascontiguousarray(data['Close'].to_numpy(dtype=np.float64))
+        
+        # Validate up front so the kernel can score every cell without raising:
+        # a window needs at least two bars and must leave at least two returns
+        window_sizes = window_sizes[(window_sizes >= 2) & (window_sizes <= len(close) - 1)]
+        if np.isnan(close).any():
+            print("Close prices contain missing values; drop them before optimizing.")
+            window_sizes = window_sizes[:0]
+        
+        # Rolling statistics per window, one row each, from the same source as the backtest
+        mids = np.empty((len(window_sizes), len(close)))
+        stds = np.empty((len(window_sizes), len(close)))
+        for i, window in enumerate(window_sizes):
+            mids[i], stds[i] = rolling_stats(close, int(window))
+        
+        # Size the kernel's thread pool for this call only
+        max_threads = numba_config.NUMBA_NUM_THREADS
+        n_threads = max_threads + 1 + n_jobs if n_jobs < 0 else n_jobs
+        previous_threads = get_num_threads()
+        set_num_threads(min(max(n_threads, 1), max_threads))
+        try:
+            sharpes = optimize_grid(close, window_sizes, mids, stds, num_stds)
+        finally:
+            set_num_threads(previous_threads)
+        
+        # argmax returns the first maximum, so ties keep the earliest grid point as before
+        if sharpes.size and np.isfinite(sharpes.max()):
+            i, j = np.unravel_index(np.argmax(sharpes), sharpes.shape)
+            best_window = int(window_sizes[i])
+            best_num_std = num_stds[j]
+            best_sharpe = sharpes[i, j]
+        else:
             print("Optimization failed to find optimal parameters. Using defaults.")
             best_window = 20
             best_num_std = 2.0
@@ -237,4 +346,4 @@ class BollingerBandsStrategy:
         self.window = best_window
         self.num_std = best_num_std
         
-        return best_window, best_num_std, best_sharpe 
\ No newline at end of file
+        return best_window, best_num_std, best_sharpe
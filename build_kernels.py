@@ -0,0 +1,38 @@
+"""
+Ahead-of-time compile the Bollinger Bands kernels into a native extension.
+
+Run once after installing the requirements:
+
+    python build_kernels.py
+
+This produces the bollinger_kernels_aot extension module next to this file.
+When it is importable the backtest script and the web app use it directly and
+skip Numba's JIT compilation; otherwise they fall back to bollinger_kernels.
+"""
+
+import os
+
+from numba.pycc import CC
+
+from bollinger_kernels import rolling_mean_std, bb_backtest
+
+cc = CC('bollinger_kernels_aot')
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+# The extension is built on the machine that runs it, so target the host CPU
+# and let LLVM vectorize the rolling sums with its full instruction set
+cc.target_cpu = 'host'
+
+# rolling_stats hands the kernel float32 prices (see bollinger_strategy)
+cc.export(
+    'rolling_mean_std',
+    'Tuple((f8[:], f8[:]))(f4[:], i8)'
+)(rolling_mean_std.py_func)
+
+cc.export(
+    'bb_backtest',
+    'Tuple((f8[:], f8[:], i1[:], i1[:], f8[:], f8[:]))(f8[:], f8[:], f8[:], i8, f8, f8)'
+)(bb_backtest.py_func)
+
+if __name__ == "__main__":
+    cc.compile()
+    print(f"Compiled bollinger_kernels_aot into {cc.output_dir}")
@@ -7,7 +7,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 from datetime import datetime
 
-from utils import fetch_data, calculate_performance_metrics, print_performance_metrics
+from utils import fetch_data, print_performance_metrics
 from bollinger_strategy import BollingerBandsStrategy
 
 def compare_strategies(ticker, start_date, end_date, initial_capital=10000.0, strategies=None):
@@ -46,44 +46,35 @@ def compare_strategies(ticker, start_date, end_date, initial_capital=10000.0, st
         print("No data available. Exiting.")
         return
     
-    # Ensure data is clean and properly formatted
-    data = data.copy()
-    data.dropna(inplace=True)
+    # Ensure data is clean; only Close is used, so skip the dropna copy unless it has gaps
+    if np.isnan(data['Close'].to_numpy()).any():
+        data = data.dropna(subset=['Close'])
     
     print(f"Data fetched successfully. {len(data)} data points.")
     
-    # Run backtest for each strategy
+    # Run every backtest in one batch so the close prices and rolling statistics are shared
+    print(f"\nRunning backtests for {len(strategies)} strategies...")
+    backtests = BollingerBandsStrategy.batch_backtest(data, strategies, initial_capital)
+    
     results = []
     portfolio_values = pd.DataFrame(index=data.index)
     
     for strategy_config in strategies:
         name = strategy_config['name']
-        window = strategy_config['window']
-        num_std = strategy_config['num_std']
+        if name not in backtests:
+            continue
+        positions, signal_points, metrics = backtests[name]
+        final_capital = positions['portfolio_value'].iloc[-1]
         
-        print(f"\nRunning backtest for strategy: {name}")
-        strategy = BollingerBandsStrategy(window=window, num_std=num_std)
+        # Add to results
+        metrics['name'] = name
+        metrics['window'] = strategy_config['window']
+        metrics['num_std'] = strategy_config['num_std']
+        metrics['final_capital'] = final_capital
+        results.append(metrics)
         
-        try:
-            positions, signal_points = strategy.backtest(data, initial_capital)
-            
-            # Calculate performance metrics
-            returns = positions['strategy_returns'].dropna()
-            final_capital = positions['portfolio_value'].iloc[-1]
-            metrics = calculate_performance_metrics(initial_capital, final_capital, returns)
-            
-            # Add to results
-            metrics['name'] = name
-            metrics['window'] = window
-            metrics['num_std'] = num_std
-            metrics['final_capital'] = final_capital
-            results.append(metrics)
-            
-            # Add portfolio value to comparison DataFrame
-            portfolio_values[name] = positions['portfolio_value']
-        except Exception as e:
-            print(f"Error running backtest for strategy {name}: {e}")
-            continue
+        # Add portfolio value to comparison DataFrame
+        portfolio_values[name] = positions['portfolio_value']
     
     if not results:
         print("No successful backtests. Exiting.")
@@ -3,8 +3,12 @@ Example script demonstrating how to use the Bollinger Bands backtesting framewor
 """
 
 from bollinger_backtest import run_backtest
+from utils import fetch_data
 
 if __name__ == "__main__":
+    # Download all example tickers in one batched request; each run below reads the cache
+    fetch_data(['TSLA', 'MSFT', 'AMZN'], start_date='2020-01-01', end_date='2023-12-31')
+    
     # Example 1: Basic backtest with default parameters
     print("Example 1: Basic backtest of TSLA with default parameters")
     run_backtest(
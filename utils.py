@@ -1,38 +1,145 @@
+import os
+import hashlib
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import yfinance as yf
 from datetime import datetime, timedelta
 
-def fetch_data(ticker, start_date, end_date, interval='1d'):
+# Directory for on-disk copies of downloaded market data, next to this module
+# so scripts run from other directories share it
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+# In-memory cache of recently used downloads for the current process, least
+# recently used entries are evicted beyond MEMORY_CACHE_SIZE
+MEMORY_CACHE_SIZE = 32
+_data_cache = OrderedDict()
+
+def _remember(key, data):
+    """
+    Add data to the in-memory cache, evicting the least recently used entry if full.
+    """
+    _data_cache[key] = data
+    _data_cache.move_to_end(key)
+    while len(_data_cache) > MEMORY_CACHE_SIZE:
+        _data_cache.popitem(last=False)
+
+def _cache_path(ticker, start_date, end_date, interval):
+    """
+    Path of the parquet file caching one download.
+    
+    The request is hashed so tickers such as '^GSPC' or 'BRK/B' still map to
+    valid file names.
+    """
+    key = hashlib.sha1(f"{ticker}|{start_date}|{end_date}|{interval}".encode()).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}.parquet")
+
+def _read_cached(ticker, start_date, end_date, interval):
+    """
+    Return cached data for one download request, or None on a cache miss.
+    """
+    key = (ticker, start_date, end_date, interval)
+    if key in _data_cache:
+        _data_cache.move_to_end(key)
+        return _data_cache[key]
+    
+    cache_path = _cache_path(ticker, start_date, end_date, interval)
+    if os.path.exists(cache_path):
+        try:
+            data = pd.read_parquet(cache_path)
+            _remember(key, data)
+            return data
+        except Exception as e:
+            print(f"Error reading cached data for {ticker}: {e}")
+    
+    return None
+
+def _write_cached(ticker, start_date, end_date, interval, data):
+    """
+    Store downloaded data in the in-memory cache and on disk.
+    """
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        data.to_parquet(_cache_path(ticker, start_date, end_date, interval))
+    except Exception as e:
+        print(f"Error caching data for {ticker}: {e}")
+    
+    _remember((ticker, start_date, end_date, interval), data)
+
+def fetch_data(ticker, start_date, end_date, interval='1d', force_refresh=False):
     """
-    Fetch historical market data for a given ticker.
+    Fetch historical market data for one or more tickers.
+    
+    Downloads are memoized in memory and persisted to parquet files under
+    CACHE_DIR, so repeated requests for the same ticker and date range skip
+    the network round-trip. When a list of tickers is given, all cache misses
+    are fetched in a single threaded yfinance request.
     
     Parameters:
     -----------
-    ticker : str
-        The ticker symbol of the stock
+    ticker : str or list
+        The ticker symbol of the stock, or a list of ticker symbols
     start_date : str
         Start date in format 'YYYY-MM-DD'
     end_date : str
         End date in format 'YYYY-MM-DD'
     interval : str, optional
         Data interval (default: '1d' for daily)
+    force_refresh : bool, optional
+        Ignore cached copies and download the data again (default: False)
         
     Returns:
     --------
-    pandas.DataFrame
-        Historical market data
+    pandas.DataFrame or dict
+        Historical market data; for a list of tickers, a dictionary mapping
+        each ticker to its DataFrame (None where no data was found)
     """
-    try:
-        data = yf.download(ticker, start=start_date, end=end_date, interval=interval)
-        if data.empty:
-            print(f"No data found for {ticker} between {start_date} and {end_date}")
-            return None
-        return data
-    except Exception as e:
-        print(f"Error fetching data for {ticker}: {e}")
-        return None
+    tickers = [ticker] if isinstance(ticker, str) else list(dict.fromkeys(ticker))
+    
+    results = {}
+    missing = []
+    for t in tickers:
+        data = None if force_refresh else _read_cached(t, start_date, end_date, interval)
+        if data is None:
+            missing.append(t)
+        else:
+            results[t] = data
+    
+    if missing:
+        # yfinance is only needed on a cache miss, so import it lazily
+        import yfinance as yf
+        
+        try:
+            downloaded = yf.download(' '.join(missing), start=start_date, end=end_date, interval=interval,
+                                     threads=True, progress=False, group_by='ticker')
+        except Exception as e:
+            print(f"Error fetching data for {', '.join(missing)}: {e}")
+            downloaded = pd.DataFrame()
+        
+        # Multi-ticker downloads are grouped under a top-level column per ticker;
+        # yfinance upper-cases those keys, so match them case-insensitively
+        groups = {}
+        if isinstance(downloaded.columns, pd.MultiIndex):
+            groups = {str(key).upper(): key for key in downloaded.columns.get_level_values(0).unique()}
+        
+        for t in missing:
+            if not isinstance(downloaded.columns, pd.MultiIndex):
+                data = downloaded
+            elif t.upper() in groups:
+                data = downloaded[groups[t.upper()]].dropna(how='all')
+            else:
+                data = pd.DataFrame()
+            
+            if data.empty:
+                print(f"No data found for {t} between {start_date} and {end_date}")
+                results[t] = None
+                continue
+            
+            _write_cached(t, start_date, end_date, interval, data)
+            results[t] = data
+    
+    if isinstance(ticker, str):
+        return results[ticker]
+    return {t: results[t] for t in tickers}
 
 def plot_bollinger_bands(data, ticker, signals=None):
     """
@@ -47,6 +154,8 @@ def plot_bollinger_bands(data, ticker, signals=None):
     signals : pandas.DataFrame, optional
         DataFrame containing buy/sell signals
     """
+    import matplotlib.pyplot as plt
+    
     plt.figure(figsize=(12, 6))
     
     # Plot close price
@@ -76,7 +185,8 @@ def plot_bollinger_bands(data, ticker, signals=None):
     
     return plt
 
-def calculate_performance_metrics(initial_capital, final_capital, returns, risk_free_rate=0.02, trading_days=252):
+def calculate_performance_metrics(initial_capital, final_capital, returns, risk_free_rate=0.02, trading_days=252,
+                                  portfolio_value=None):
     """
     Calculate performance metrics for a trading strategy.
     
@@ -86,8 +196,63 @@ def calculate_performance_metrics(initial_capital, final_capital, returns, risk_
         Initial investment amount
     final_capital : float
         Final portfolio value
-    returns : pandas.Series
-        Daily returns of the strategy
+    returns : numpy.ndarray or pandas.Series
+        Daily returns of the strategy, without NaN values
+    risk_free_rate : float, optional
+        Annual risk-free rate (default: 0.02 or 2%)
+    trading_days : int, optional
+        Number of trading days in a year (default: 252)
+    portfolio_value : numpy.ndarray or pandas.Series, optional
+        Portfolio value aligned with returns; when given, drawdowns are taken
+        from it instead of recompounding the returns (default: None)
+        
+    Returns:
+    --------
+    dict
+        Dictionary containing performance metrics
+    """
+    # Work on plain float64 arrays so nothing below goes through pandas dispatch
+    returns = np.asarray(returns, dtype=np.float64)
+    if portfolio_value is not None:
+        portfolio_value = np.asarray(portfolio_value, dtype=np.float64)
+    
+    # Summary statistics of the daily returns
+    if portfolio_value is not None:
+        cumulative_returns = portfolio_value
+    else:
+        cumulative_returns = np.cumprod(1 + returns)
+    running_max = np.maximum.accumulate(cumulative_returns)
+    max_drawdown = ((cumulative_returns / running_max) - 1).min()
+    
+    return performance_metrics_from_summary(
+        initial_capital, final_capital, returns.size, returns.mean(), returns.std(ddof=1),
+        np.count_nonzero(returns > 0), max_drawdown, risk_free_rate, trading_days
+    )
+
+def performance_metrics_from_summary(initial_capital, final_capital, n_returns, mean_return, std_return,
+                                     n_wins, max_drawdown, risk_free_rate=0.02, trading_days=252):
+    """
+    Format performance metrics from summary statistics of the daily returns.
+    
+    The statistics can come from calculate_performance_metrics or directly
+    from the bb_backtest kernel, which accumulates them during the backtest.
+    
+    Parameters:
+    -----------
+    initial_capital : float
+        Initial investment amount
+    final_capital : float
+        Final portfolio value
+    n_returns : int
+        Number of daily returns
+    mean_return : float
+        Mean daily return
+    std_return : float
+        Sample (ddof=1) standard deviation of the daily returns
+    n_wins : int
+        Number of days with a positive return
+    max_drawdown : float
+        Maximum drawdown of the portfolio value
     risk_free_rate : float, optional
         Annual risk-free rate (default: 0.02 or 2%)
     trading_days : int, optional
@@ -102,7 +267,7 @@ def calculate_performance_metrics(initial_capital, final_capital, returns, risk_
     total_return = (final_capital - initial_capital) / initial_capital
     
     # Annualized return
-    period_years = len(returns) / trading_days
+    period_years = n_returns / trading_days
     
     # Handle negative total returns for annualized calculation
     if total_return <= -1:
@@ -110,28 +275,92 @@ def calculate_performance_metrics(initial_capital, final_capital, returns, risk_
     else:
         annualized_return = (1 + total_return) ** (1 / period_years) - 1
     
-    # Volatility (annualized standard deviation)
-    daily_std = returns.std()
-    annualized_std = daily_std * np.sqrt(trading_days)
+    # Volatility (annualized sample standard deviation)
+    annualized_std = std_return * np.sqrt(trading_days)
     
     # Sharpe ratio
     daily_risk_free = (1 + risk_free_rate) ** (1 / trading_days) - 1
-    excess_returns = returns - daily_risk_free
     
     # Avoid division by zero
-    if daily_std > 0:
-        sharpe_ratio = (excess_returns.mean() / returns.std()) * np.sqrt(trading_days)
+    if std_return > 0:
+        sharpe_ratio = ((mean_return - daily_risk_free) / std_return) * np.sqrt(trading_days)
     else:
         sharpe_ratio = 0
     
+    # Win rate
+    win_rate = n_wins / n_returns if n_returns > 0 else 0
+    
+    metrics = {
+        'Total Return': total_return,
+        'Annualized Return': annualized_return,
+        'Annualized Volatility': annualized_std,
+        'Sharpe Ratio': sharpe_ratio,
+        'Maximum Drawdown': max_drawdown,
+        'Win Rate': win_rate
+    }
+    
+    return metrics
+
+def calculate_performance_metrics_matrix(initial_capital, portfolio_values, risk_free_rate=0.02, trading_days=252):
+    """
+    Calculate performance metrics for several strategies in one vectorized pass.
+    
+    Produces the same metrics as calculate_performance_metrics, with daily
+    returns derived from each strategy's portfolio value.
+    
+    Parameters:
+    -----------
+    initial_capital : float
+        Initial investment amount
+    portfolio_values : numpy.ndarray
+        2-D array of portfolio values (bars x strategies), NaN before each
+        strategy's first bar
+    risk_free_rate : float, optional
+        Annual risk-free rate (default: 0.02 or 2%)
+    trading_days : int, optional
+        Number of trading days in a year (default: 252)
+        
+    Returns:
+    --------
+    dict
+        Dictionary mapping each metric to an array with one value per strategy
+    """
+    pv = np.asarray(portfolio_values, dtype=np.float64)
+    valid = ~np.isnan(pv)
+    
+    # Daily returns; each strategy's first bar has a zero return
+    prev = np.full_like(pv, np.nan)
+    prev[1:] = pv[:-1]
+    returns = pv / prev - 1
+    returns[valid & np.isnan(prev)] = 0
+    n_returns = valid.sum(axis=0)
+    
+    # Total return
+    final_capital = pv[-1]
+    total_return = (final_capital - initial_capital) / initial_capital
+    
+    # Annualized return, with a complete loss capped at -100%
+    period_years = n_returns / trading_days
+    annualized_return = np.maximum(1 + total_return, 0) ** (1 / period_years) - 1
+    annualized_return[total_return <= -1] = -1.0
+    
+    # Volatility (annualized sample standard deviation)
+    daily_std = np.nanstd(returns, axis=0, ddof=1)
+    annualized_std = daily_std * np.sqrt(trading_days)
+    
+    # Sharpe ratio, zero where the volatility is zero
+    daily_risk_free = (1 + risk_free_rate) ** (1 / trading_days) - 1
+    excess_mean = np.nanmean(returns, axis=0) - daily_risk_free
+    sharpe_ratio = np.zeros_like(daily_std)
+    np.divide(excess_mean, daily_std, out=sharpe_ratio, where=daily_std > 0)
+    sharpe_ratio *= np.sqrt(trading_days)
+    
     # Maximum drawdown
-    cumulative_returns = (1 + returns).cumprod()
-    running_max = cumulative_returns.cummax()
-    drawdown = (cumulative_returns / running_max) - 1
-    max_drawdown = drawdown.min()
+    running_max = np.fmax.accumulate(pv, axis=0)
+    max_drawdown = np.nanmin(pv / running_max - 1, axis=0)
     
     # Win rate
-    win_rate = len(returns[returns > 0]) / len(returns) if len(returns) > 0 else 0
+    win_rate = (returns > 0).sum(axis=0) / np.maximum(n_returns, 1)
     
     metrics = {
         'Total Return': total_return,